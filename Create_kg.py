@@ -1,12 +1,42 @@
+import argparse
 import pandas as pd
 from neo4j import GraphDatabase
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
 import sys
 
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pac
+except ImportError:
+    pa = None
+
 # =========================
 # CONFIGURATION
 # =========================
 CONFIG_FILE = 'config.txt'
 CSV_FILE = 'Airline_surveys_sample.csv'
+MAX_WORKERS = 8
+
+# Columns used by the graph and the dtype each one is parsed as.
+COLUMN_TYPES = {
+    'record_locator': 'string',
+    'loyalty_program_level': 'category',
+    'generation': 'category',
+    'origin_station_code': 'category',
+    'destination_station_code': 'category',
+    'flight_number': 'Int64',
+    'fleet_type_description': 'category',
+    'feedback_ID': 'string',
+    'food_satisfaction_score': 'Int32',
+    'arrival_delay_minutes': 'Int32',
+    'actual_flown_miles': 'Int32',
+    'number_of_legs': 'Int8',
+    'passenger_class': 'string',
+}
+NUMERIC_COLUMNS = ['food_satisfaction_score', 'arrival_delay_minutes', 'actual_flown_miles', 'number_of_legs']
+
+FLIGHT_INDEX_QUERY = "CREATE INDEX flight_composite_index IF NOT EXISTS FOR (f:Flight) ON (f.flight_number, f.fleet_type_description)"
 
 
 def read_config(file_path):
@@ -34,11 +64,17 @@ def create_constraints(driver):
         "CREATE CONSTRAINT passenger_id IF NOT EXISTS FOR (p:Passenger) REQUIRE p.record_locator IS UNIQUE",
         "CREATE CONSTRAINT journey_id IF NOT EXISTS FOR (j:Journey) REQUIRE j.feedback_ID IS UNIQUE",
         "CREATE CONSTRAINT airport_id IF NOT EXISTS FOR (a:Airport) REQUIRE a.station_code IS UNIQUE",
-        "CREATE INDEX flight_composite_index IF NOT EXISTS FOR (f:Flight) ON (f.flight_number, f.fleet_type_description)"
+        FLIGHT_INDEX_QUERY,
+        # Lookup indexes for the Milestone3 query templates
+        # (Airport.station_code and Passenger.record_locator are covered by the constraints above)
+        "CREATE INDEX flight_number_index IF NOT EXISTS FOR (f:Flight) ON (f.flight_number)",
+        "CREATE INDEX passenger_loyalty_index IF NOT EXISTS FOR (p:Passenger) ON (p.loyalty_program_level)",
+        "CREATE INDEX journey_class_index IF NOT EXISTS FOR (j:Journey) ON (j.passenger_class)",
+        "CREATE FULLTEXT INDEX fleet_ft IF NOT EXISTS FOR (f:Flight) ON EACH [f.fleet_type_description]"
     ]
+    # One transaction for all DDL instead of one auto-commit per statement.
     with driver.session() as session:
-        for q in queries:
-            session.run(q)
+        session.execute_write(lambda tx: [tx.run(q).consume() for q in queries])
         print("Constraints and indexes verified.")
 
 
@@ -49,26 +85,53 @@ def print_statistics(driver):
     """Prints statistics about the created Knowledge Graph."""
     print("\nKnowledge Graph Statistics:")
 
-    queries = {
-        "Passengers": "MATCH (p:Passenger) RETURN count(p) as count",
-        "Journeys": "MATCH (j:Journey) RETURN count(j) as count",
-        "Flights": "MATCH (f:Flight) RETURN count(f) as count",
-        "Airports": "MATCH (a:Airport) RETURN count(a) as count",
-        "TOOK relationships": "MATCH ()-[r:TOOK]->() RETURN count(r) as count",
-        "ON relationships": "MATCH ()-[r:ON]->() RETURN count(r) as count",
-        "DEPARTS_FROM relationships": "MATCH ()-[r:DEPARTS_FROM]->() RETURN count(r) as count",
-        "ARRIVES_AT relationships": "MATCH ()-[r:ARRIVES_AT]->() RETURN count(r) as count"
+    node_labels = {
+        "Passengers": "Passenger",
+        "Journeys": "Journey",
+        "Flights": "Flight",
+        "Airports": "Airport",
     }
+    rel_types = ["TOOK", "ON", "DEPARTS_FROM", "ARRIVES_AT"]
 
     with driver.session() as session:
-        for label, query in queries.items():
-            result = session.run(query)
-            print(f"  - {label}: {result.single()['count']}")
+        # The built-in graph counts hold every label and type count in one call.
+        try:
+            data = session.run(
+                "CALL db.stats.retrieve('GRAPH COUNTS') YIELD data RETURN data"
+            ).single()["data"]
+            label_counts = {n["label"]: n["count"] for n in data["nodes"] if "label" in n}
+            rel_counts = {r["relationshipType"]: r["count"] for r in data["relationships"]
+                          if "relationshipType" in r and "startLabel" not in r and "endLabel" not in r}
+            counts = {name: label_counts.get(label, 0) for name, label in node_labels.items()}
+            counts.update({rel: rel_counts.get(rel, 0) for rel in rel_types})
+        except Exception:
+            # If the procedure is unavailable (or not permitted), fetch all
+            # counts in one round-trip; each subquery
+            # is a plain label/type count, which the planner serves from the count store.
+            subqueries = [f"CALL {{ MATCH (n:{label}) RETURN count(n) AS {label} }}"
+                          for label in node_labels.values()]
+            subqueries += [f"CALL {{ MATCH ()-[r:{rel}]->() RETURN count(r) AS {rel} }}"
+                           for rel in rel_types]
+            query = "\n".join(subqueries) + "\nRETURN *"
+            record = session.run(query).single()
+            counts = {name: record[label] for name, label in node_labels.items()}
+            counts.update({rel: record[rel] for rel in rel_types})
+
+    for name in node_labels:
+        print(f"  - {name}: {counts[name]}")
+    for rel in rel_types:
+        print(f"  - {rel} relationships: {counts[rel]}")
 
 
 # =========================
 # VERIFICATION QUERIES 1–5
 # =========================
+def _run_read(driver, query):
+    """Runs one read query in its own session and returns all its records."""
+    with driver.session() as session:
+        return list(session.run(query))
+
+
 def run_verification_queries(driver):
     print("\n==============================")
     print("RUNNING VERIFICATION QUERIES")
@@ -155,36 +218,40 @@ WHERE overall_satisfaction_score > 3
 RETURN count(p) AS qualified_passengers;
     """
 
-    with driver.session() as session:
-        # Query 1
-        print("Query 1 — Top 5 Routes by Number of Flights:\n")
-        for r in session.run(q1):
-            print(f"  {r['origin']} → {r['destination']} | flights: {r['flight_count']}")
-
-        # Query 2
-        print("\nQuery 2 — Top 10 Flights by Passenger Feedback:\n")
-        for r in session.run(q2):
-            print(f"  Flight {r['flight_number']} | feedbacks: {r['passenger_feedback_count']}")
-
-        # Query 3
-        print("\nQuery 3 — Avg Food Satisfaction for Multi-Leg Journeys:\n")
-        for r in session.run(q3):
-            print(f"  {r['generation']} | journeys: {r['multi_leg_count']} | avg score: {r['avg_score']}")
-
-        # Query 4
-        print("\nQuery 4 — Flights with Shortest Arrival Delay:\n")
-        for r in session.run(q4):
-            print(f"  Flight {r['flight_id']} | avg delay: {r['avg_arrival_delay']} minutes")
-
-        # Query 5
-        print("\nQuery 5 — Avg Flown Miles by Loyalty Level:\n")
-        for r in session.run(q5):
-            print(f"  {r['loyalty_level']} | avg miles: {r['avg_actual_flown_miles']}")
-
-        #Satisfaction Rule Query
-        print("\nPassengers with Overall Satisfaction Score > 3:\n")
-        for r in session.run(q6):
-            print(f"Actual Count: {r['qualified_passengers']}")
+    # The queries are independent reads, so they run concurrently and are
+    # printed in order once all results are back.
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        r1, r2, r3, r4, r5, r6 = executor.map(_run_read, repeat(driver), [q1, q2, q3, q4, q5, q6])
+
+    # Query 1
+    print("Query 1 — Top 5 Routes by Number of Flights:\n")
+    for r in r1:
+        print(f"  {r['origin']} → {r['destination']} | flights: {r['flight_count']}")
+
+    # Query 2
+    print("\nQuery 2 — Top 10 Flights by Passenger Feedback:\n")
+    for r in r2:
+        print(f"  Flight {r['flight_number']} | feedbacks: {r['passenger_feedback_count']}")
+
+    # Query 3
+    print("\nQuery 3 — Avg Food Satisfaction for Multi-Leg Journeys:\n")
+    for r in r3:
+        print(f"  {r['generation']} | journeys: {r['multi_leg_count']} | avg score: {r['avg_score']}")
+
+    # Query 4
+    print("\nQuery 4 — Flights with Shortest Arrival Delay:\n")
+    for r in r4:
+        print(f"  Flight {r['flight_id']} | avg delay: {r['avg_arrival_delay']} minutes")
+
+    # Query 5
+    print("\nQuery 5 — Avg Flown Miles by Loyalty Level:\n")
+    for r in r5:
+        print(f"  {r['loyalty_level']} | avg miles: {r['avg_actual_flown_miles']}")
+
+    #Satisfaction Rule Query
+    print("\nPassengers with Overall Satisfaction Score > 3:\n")
+    for r in r6:
+        print(f"Actual Count: {r['qualified_passengers']}")
 
     print("\nVerification queries complete.\n")
 
@@ -225,82 +292,260 @@ def run_interactive_queries(driver):
 # =========================
 # LOAD CSV INTO NEO4J
 # =========================
-def load_data(driver, csv_path):
+def _run_batch(driver, cypher_query, params):
+    """Writes one batch in its own session; returns the error instead of raising."""
+    try:
+        with driver.session() as session:
+            session.execute_write(lambda tx: tx.run(cypher_query, params).consume())
+        return None
+    except Exception as e:
+        return e
+
+
+def iter_survey_csv(csv_path, names, chunk_size):
+    """
+    Streams only the mapped columns with fixed types, renamed to the schema.
+    Uses pyarrow's multi-threaded streaming parser when available, else pandas'
+    C engine; either way only one chunk is held in memory at a time.
+    """
+    if pa is not None:
+        arrow_types = {'string': pa.string(), 'category': pa.string(),
+                       'Int64': pa.int64(), 'Int32': pa.int32(), 'Int8': pa.int8()}
+        reader = pac.open_csv(
+            csv_path,
+            read_options=pac.ReadOptions(block_size=8 << 20),
+            convert_options=pac.ConvertOptions(
+                include_columns=list(names),
+                # Empty string cells become nulls, as in pandas, so fillna applies
+                strings_can_be_null=True,
+                column_types={raw: arrow_types[COLUMN_TYPES[name]] for raw, name in names.items()},
+            ),
+        )
+        chunks = (b.to_pandas(types_mapper=pd.ArrowDtype) for b in reader)
+    else:
+        # Explicit dtypes skip pandas' inference pass and usecols skips unused columns.
+        chunks = pd.read_csv(
+            csv_path,
+            usecols=list(names),
+            dtype={raw: COLUMN_TYPES[name] for raw, name in names.items()},
+            engine='c',
+            chunksize=chunk_size,
+        )
+
+    for df in chunks:
+        df = df.rename(columns=names)
+        df[NUMERIC_COLUMNS] = df[NUMERIC_COLUMNS].fillna(0)
+        df['passenger_class'] = df['passenger_class'].fillna("Unknown")
+        yield df
+
+
+# Parameters are sent column-wise ({column: [values]}) rather than as a
+# list of row dicts, so each query walks the arrays by position.
+PASSENGER_QUERY = """
+UNWIND range(0, size($record_locator) - 1) AS i
+MERGE (p:Passenger {record_locator: $record_locator[i]})
+SET p += {loyalty_program_level: $loyalty_program_level[i], generation: $generation[i]}
+"""
+
+AIRPORT_QUERY = """
+UNWIND $station_code AS station_code
+MERGE (:Airport {station_code: station_code})
+"""
+
+FLIGHT_QUERY = """
+UNWIND range(0, size($flight_number) - 1) AS i
+MERGE (:Flight {flight_number: $flight_number[i], fleet_type_description: $fleet_type_description[i]})
+"""
+
+# Bulk mode only: flights are deduplicated across the whole file in Python,
+# so a plain CREATE is safe on an empty database.
+FLIGHT_CREATE_QUERY = """
+UNWIND range(0, size($flight_number) - 1) AS i
+CREATE (:Flight {flight_number: $flight_number[i], fleet_type_description: $fleet_type_description[i]})
+"""
+
+JOURNEY_QUERY = """
+UNWIND range(0, size($feedback_ID) - 1) AS i
+MERGE (j:Journey {feedback_ID: $feedback_ID[i]})
+SET j += {
+    food_satisfaction_score: $food_satisfaction_score[i],
+    arrival_delay_minutes: $arrival_delay_minutes[i],
+    actual_flown_miles: $actual_flown_miles[i],
+    number_of_legs: $number_of_legs[i],
+    passenger_class: $passenger_class[i]
+}
+"""
+
+JOURNEY_RELATIONSHIP_QUERY = """
+UNWIND range(0, size($feedback_ID) - 1) AS i
+MATCH (p:Passenger {record_locator: $record_locator[i]})
+MATCH (j:Journey {feedback_ID: $feedback_ID[i]})
+MATCH (f:Flight {flight_number: $flight_number[i], fleet_type_description: $fleet_type_description[i]})
+MERGE (p)-[:TOOK]->(j)
+MERGE (j)-[:ON]->(f)
+"""
+
+ROUTE_RELATIONSHIP_QUERY = """
+UNWIND range(0, size($flight_number) - 1) AS i
+MATCH (f:Flight {flight_number: $flight_number[i], fleet_type_description: $fleet_type_description[i]})
+MATCH (o:Airport {station_code: $origin_station_code[i]})
+MATCH (d:Airport {station_code: $destination_station_code[i]})
+MERGE (f)-[:DEPARTS_FROM]->(o)
+MERGE (f)-[:ARRIVES_AT]->(d)
+"""
+
+
+def node_passes(df, seen_flights=None):
+    """
+    Builds the deduplicated node passes for one chunk. When seen_flights is
+    given (bulk mode), flights already written by earlier chunks are dropped
+    and the pass uses CREATE instead of MERGE.
+    """
+    passengers = df[['record_locator', 'loyalty_program_level', 'generation']] \
+        .drop_duplicates('record_locator')
+
+    airports = pd.concat([df['origin_station_code'], df['destination_station_code']]) \
+        .drop_duplicates().to_frame('station_code')
+
+    flights = df[['flight_number', 'fleet_type_description']].drop_duplicates()
+    flight_query = FLIGHT_QUERY
+    if seen_flights is not None:
+        keys = list(zip(flights['flight_number'].tolist(), flights['fleet_type_description'].tolist()))
+        flights = flights[[key not in seen_flights for key in keys]]
+        seen_flights.update(keys)
+        flight_query = FLIGHT_CREATE_QUERY
+
+    journeys = df[['feedback_ID', 'food_satisfaction_score', 'arrival_delay_minutes',
+                   'actual_flown_miles', 'number_of_legs', 'passenger_class']] \
+        .drop_duplicates('feedback_ID')
+
+    return [
+        ("Passengers", passengers, PASSENGER_QUERY),
+        ("Airports", airports, AIRPORT_QUERY),
+        ("Flights", flights, flight_query),
+        ("Journeys", journeys, JOURNEY_QUERY),
+    ]
+
+
+def relationship_passes(df):
+    """
+    Builds the relationship passes for one chunk; their nodes must already exist.
+    Route edges repeat for every journey on a flight, so they are deduplicated
+    and written separately from the per-journey edges.
+    """
+    journey_links = df[['record_locator', 'feedback_ID', 'flight_number', 'fleet_type_description']] \
+        .drop_duplicates('feedback_ID')
+
+    routes = df[['flight_number', 'fleet_type_description',
+                 'origin_station_code', 'destination_station_code']].drop_duplicates()
+
+    return [
+        ("TOOK/ON relationships", journey_links, JOURNEY_RELATIONSHIP_QUERY),
+        ("Route relationships", routes, ROUTE_RELATIONSHIP_QUERY),
+    ]
+
+
+def run_passes(driver, executor, passes, batch_size):
+    """
+    Runs the passes in order (relationships need their nodes); the batches
+    inside a pass are independent and are committed concurrently.
+    """
+    for label, frame, cypher_query in passes:
+        total_rows = len(frame)
+        starts = range(0, total_rows, batch_size)
+        batches = [
+            {col: frame[col].values[i:i+batch_size].tolist() for col in frame.columns}
+            for i in starts
+        ]
+        results = executor.map(_run_batch, repeat(driver), repeat(cypher_query), batches)
+        failed = 0
+        for i, error in zip(starts, results):
+            if error:
+                failed += 1
+                print(f"Error in {label} batch starting at row {i}: {error}")
+        # One progress line per pass rather than per batch
+        print(f"  {label}: {total_rows} rows in {len(batches)} batches ({failed} failed)")
+
+
+def load_data(driver, csv_path, bulk=False):
+    """
+    Loads the survey CSV into Neo4j using managed write transactions.
+
+    The file is streamed in chunks so peak memory is bounded by the chunk size.
+    Each batch is one committed transaction, so batch_size trades commit/WAL
+    flush overhead against transaction memory. Large ingests grow the
+    transaction log quickly; keep dbms.tx_log.rotation.retention_policy
+    bounded on the server when loading big files.
+
+    bulk=True is for loading into an empty database: the flight index is
+    dropped while nodes are written (flights with CREATE), rebuilt once, and
+    the relationships are written in a second sweep over the file.
+    """
     print(f"Reading {csv_path}...")
 
     try:
-        df = pd.read_csv(csv_path)
+        header = pd.read_csv(csv_path, nrows=0).columns
     except FileNotFoundError:
         print(f"Error: {csv_path} not found.")
         sys.exit(1)
 
-    df.columns = df.columns.str.strip()
+    # Map the raw header names onto the schema names (headers may be padded,
+    # and older exports call passenger_class just 'class').
+    stripped = [c.strip() for c in header]
+    names = {}
+    for raw, name in zip(header, stripped):
+        if name == 'class' and 'passenger_class' not in stripped:
+            name = 'passenger_class'
+        if name in COLUMN_TYPES:
+            names[raw] = name
+
+    missing = set(COLUMN_TYPES) - set(names.values())
+    if missing:
+        print(f"Error: Could not find columns: {sorted(missing)}")
+        print("Columns:", list(header))
+        sys.exit(1)
 
-    if 'passenger_class' not in df.columns:
-        if 'class' in df.columns:
-            df.rename(columns={'class': 'passenger_class'}, inplace=True)
+    batch_size = 5000
+    chunk_size = 50000
+    total_rows = 0
+    print("Starting ingestion...")
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        if not bulk:
+            for df in iter_survey_csv(csv_path, names, chunk_size):
+                print(f"Ingesting records {total_rows} → {total_rows + len(df)}")
+                run_passes(driver, executor, node_passes(df) + relationship_passes(df), batch_size)
+                total_rows += len(df)
         else:
-            print("Error: Could not find passenger_class column.")
-            print("Columns:", list(df.columns))
-            sys.exit(1)
-
-    # Normalize numeric columns
-    df['food_satisfaction_score'] = pd.to_numeric(df['food_satisfaction_score'], errors='coerce').fillna(0).astype(int)
-    df['arrival_delay_minutes'] = pd.to_numeric(df['arrival_delay_minutes'], errors='coerce').fillna(0).astype(int)
-    df['actual_flown_miles'] = pd.to_numeric(df['actual_flown_miles'], errors='coerce').fillna(0).astype(int)
-    df['number_of_legs'] = pd.to_numeric(df['number_of_legs'], errors='coerce').fillna(0).astype(int)
-
-    df['passenger_class'] = df['passenger_class'].fillna("Unknown")
-    df['feedback_ID'] = df['feedback_ID'].astype(str)
-
-    cypher_query = """
-    UNWIND $rows AS row
-    
-    MERGE (p:Passenger {record_locator: row.record_locator})
-    SET p.loyalty_program_level = row.loyalty_program_level,
-        p.generation = row.generation
-
-    MERGE (a_origin:Airport {station_code: row.origin_station_code})
-    MERGE (a_dest:Airport {station_code: row.destination_station_code})
-
-    MERGE (f:Flight {
-        flight_number: row.flight_number,
-        fleet_type_description: row.fleet_type_description
-    })
-
-    MERGE (j:Journey {feedback_ID: row.feedback_ID})
-    SET j.food_satisfaction_score = row.food_satisfaction_score,
-        j.arrival_delay_minutes = row.arrival_delay_minutes,
-        j.actual_flown_miles = row.actual_flown_miles,
-        j.number_of_legs = row.number_of_legs,
-        j.passenger_class = row.passenger_class
-
-    MERGE (p)-[:TOOK]->(j)
-    MERGE (j)-[:ON]->(f)
-    MERGE (f)-[:DEPARTS_FROM]->(a_origin)
-    MERGE (f)-[:ARRIVES_AT]->(a_dest)
-    """
+            with driver.session() as session:
+                session.run("DROP INDEX flight_composite_index IF EXISTS").consume()
 
-    batch_size = 1000
-    total_rows = len(df)
-    print(f"Starting ingestion of {total_rows} records...")
+            seen_flights = set()
+            for df in iter_survey_csv(csv_path, names, chunk_size):
+                print(f"Ingesting nodes for records {total_rows} → {total_rows + len(df)}")
+                run_passes(driver, executor, node_passes(df, seen_flights), batch_size)
+                total_rows += len(df)
 
-    with driver.session() as session:
-        for i in range(0, total_rows, batch_size):
-            batch = df.iloc[i:i+batch_size].to_dict('records')
-            try:
-                session.run(cypher_query, rows=batch)
-                print(f"Processed rows {i} → {min(i+batch_size, total_rows)}")
-            except Exception as e:
-                print(f"Error in batch starting at row {i}: {e}")
+            print("Rebuilding flight index...")
+            with driver.session() as session:
+                session.run(FLIGHT_INDEX_QUERY).consume()
+                session.run("CALL db.awaitIndexes()").consume()
 
-    print("Data ingestion complete.")
+            for df in iter_survey_csv(csv_path, names, chunk_size):
+                run_passes(driver, executor, relationship_passes(df), batch_size)
+
+    print(f"Data ingestion complete ({total_rows} records).")
 
 
 # =========================
 # MAIN
 # =========================
 def main():
+    parser = argparse.ArgumentParser(description="Build the airline Knowledge Graph in Neo4j.")
+    parser.add_argument("--bulk", action="store_true",
+                        help="Fast initial load into an empty database (CREATE flights, rebuild index afterwards).")
+    args = parser.parse_args()
+
     config = read_config(CONFIG_FILE)
     uri = config.get('URI')
     username = config.get('USERNAME')
@@ -316,7 +561,7 @@ def main():
 
     try:
         create_constraints(driver)
-        load_data(driver, CSV_FILE)
+        load_data(driver, CSV_FILE, bulk=args.bulk)
         print_statistics(driver)
         run_verification_queries(driver)
         #run_interactive_queries(driver)
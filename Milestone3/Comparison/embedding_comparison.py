@@ -1,7 +1,12 @@
 import faiss
-import pickle
+import pyarrow as pa
+import pyarrow.parquet as pq
 import numpy as np
+import pandas as pd
 import os
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+import torch
 from neo4j import GraphDatabase
 from sentence_transformers import SentenceTransformer
 
@@ -18,6 +23,17 @@ def load_config(file_path="../../config.txt"):
         print(f"Error: {file_path} not found.")
         return None
 
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+MAX_SEQ_LENGTH = 128  # serialized passenger texts are well under this; avoids padding waste
+
+def load_model(model_name):
+    """Loads a SentenceTransformer onto the best device (FP16 on GPU)."""
+    model = SentenceTransformer(model_name, device=DEVICE)
+    model.max_seq_length = MAX_SEQ_LENGTH
+    if DEVICE == "cuda":
+        model.half()  # FP16 halves memory traffic on GPU
+    return model
+
 # 1. Neo4j Configuration
 config = load_config()
 URI = config.get("uri")
@@ -46,48 +62,64 @@ def fetch_graph_data():
     """
     try:
         with driver.session() as session:
-            result = session.run(query)
-            return [record.data() for record in result]
+            # Straight into a DataFrame, no per-record dict
+            return session.run(query).to_df()
     finally:
         driver.close()
 
-def serialize_data(data):
-    texts = []
-    for r in data:
-        # Semantic Logic
-        score = r['food_score']
-        if score >= 8: food_desc = "delicious and excellent"
-        elif score <= 3: food_desc = "terrible and poor"
-        else: food_desc = "average"
-
-        delay = r['delay']
-        if delay > 30: delay_desc = f"significantly delayed by {delay} minutes"
-        elif delay > 0: delay_desc = f"slightly delayed by {delay} minutes"
-        else: delay_desc = "on time"
-
-        text = (
-            f"Passenger {r['passenger_id']} ({r['gen']}, {r['loyalty']} status) "
-            f"booked {r['p_class']} class on Flight {r['flight_num']} "
-            f"(operated by {r['fleet']}). "
-            f"The journey from {r['origin_code']} to {r['dest_code']} "
-            f"covered {r['miles']} miles. "
-            f"Feedback: The food was {food_desc} (rated {score}/10). "
-            f"The flight was {delay_desc}."
-        )
-        texts.append(text)
-    return texts
-
-def build_index(model_name, filename, texts):
+def serialize_data(df):
+    if df.empty:
+        return []
+    s = {col: df[col].astype(str) for col in df.columns}
+
+    # Semantic Logic (vectorized)
+    food_desc = np.select(
+        [df['food_score'] >= 8, df['food_score'] <= 3],
+        ["delicious and excellent", "terrible and poor"],
+        default="average",
+    )
+    delay_desc = np.where(
+        df['delay'] > 30, "significantly delayed by " + s['delay'] + " minutes",
+        np.where(df['delay'] > 0, "slightly delayed by " + s['delay'] + " minutes", "on time"),
+    )
+
+    texts = (
+        "Passenger " + s['passenger_id'] + " (" + s['gen'] + ", " + s['loyalty'] + " status) "
+        + "booked " + s['p_class'] + " class on Flight " + s['flight_num'] + " "
+        + "(operated by " + s['fleet'] + "). "
+        + "The journey from " + s['origin_code'] + " to " + s['dest_code'] + " "
+        + "covered " + s['miles'] + " miles. "
+        + "Feedback: The food was " + food_desc + " (rated " + s['food_score'] + "/10). "
+        + "The flight was " + delay_desc + "."
+    )
+    return texts.tolist()
+
+ENCODE_BATCH_SIZE = 256
+
+def tokenize_batches(embedder, texts, batch_size=ENCODE_BATCH_SIZE):
+    """Tokenizer features for texts (capped at MAX_SEQ_LENGTH), one dict of tensors per batch."""
+    return [embedder.tokenize(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+
+def build_index(model_name, embedder, batches, filename):
     print(f"\n--- Processing Model: {model_name} ---")
-    embedder = SentenceTransformer(model_name)
     print("Encoding...")
-    embeddings = embedder.encode(texts, convert_to_numpy=True)
+    # Forward passes only; the texts were tokenized ahead of time
+    parts = []
+    with torch.inference_mode():
+        for features in batches:
+            features = {k: v.to(embedder.device) for k, v in features.items()}
+            parts.append(embedder(features)["sentence_embedding"].float().cpu().numpy())
+    embeddings = np.vstack(parts).astype(np.float32)
+    # Unit-length vectors so inner product == cosine similarity
+    faiss.normalize_L2(embeddings)
     
     # FAISS Dimension depends on the model (384 vs 768)
     d = embeddings.shape[1]
     print(f"Vector Dimensions: {d}")
     
-    index = faiss.IndexFlatL2(d)
+    # HNSW graph: approximate, log-time search instead of a full scan
+    index = faiss.IndexHNSWFlat(d, 32, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = 200
     index.add(embeddings)
     
     faiss.write_index(index, filename)
@@ -103,39 +135,54 @@ if __name__ == "__main__":
     texts = serialize_data(data)
     
     # 3. Save Text Chunks (Shared by both models)
-    with open("airline_texts.pkl", "wb") as f:
-        pickle.dump(texts, f)
-    
-    # 4. Build Index A (MiniLM - Baseline)
-    build_index("sentence-transformers/all-MiniLM-L6-v2", "airline_db_mini.index", texts)
+    pq.write_table(pa.table({"text": texts}), "airline_texts.parquet")
     
-    # 5. Build Index B (MPNet - High Performance)
-    build_index("sentence-transformers/all-mpnet-base-v2", "airline_db_mpnet.index", texts)
+    # 4. Build Index A (MiniLM - Baseline) and Index B (MPNet - High Performance)
+    model_names = ["sentence-transformers/all-MiniLM-L6-v2", "sentence-transformers/all-mpnet-base-v2"]
+    filenames = ["airline_db_mini.index", "airline_db_mpnet.index"]
+    embedders = [load_model(name) for name in model_names]
+
+    # Both tokenizers run in parallel (the fast tokenizers release the GIL);
+    # the forward passes then run one model at a time, so they don't compete
+    # for the same cores / GPU
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        features = list(executor.map(tokenize_batches, embedders, [texts, texts]))
+
+    for name, embedder, batches, filename in zip(model_names, embedders, features, filenames):
+        build_index(name, embedder, batches, filename)
     
     print("\nDONE! Ready for comparison.")
 
     
-# Load Texts
-with open("airline_texts.pkl", "rb") as f:
-    texts = pickle.load(f)
+# Load Texts (memory-mapped Arrow column, rows are decoded on access)
+texts = pq.read_table("airline_texts.parquet", memory_map=True).column("text")
 
 # Load Model A
 print("Loading Model A (MiniLM)...")
-model_a = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+model_a = load_model("sentence-transformers/all-MiniLM-L6-v2")
 index_a = faiss.read_index("airline_db_mini.index")
 
 # Load Model B
 print("Loading Model B (MPNet)...")
-model_b = SentenceTransformer("sentence-transformers/all-mpnet-base-v2")
+model_b = load_model("sentence-transformers/all-mpnet-base-v2")
 index_b = faiss.read_index("airline_db_mpnet.index")
 
-def get_results(query, model, index, k=1):
-    vec = model.encode([query], convert_to_numpy=True)
+models = {"a": model_a, "b": model_b}
+
+@lru_cache(maxsize=1024)
+def _encode(model_id, query):
+    """Cached query embedding; repeated queries skip the forward pass."""
+    return models[model_id].encode([query], convert_to_numpy=True, normalize_embeddings=True).astype(np.float32)
+
+def get_results(query, model_id, index, k=1):
+    vec = _encode(model_id, query)
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = 64
     distances, indices = index.search(vec, k)
     results = []
     for idx in indices[0]:
         if idx < len(texts):
-            results.append(texts[idx])
+            results.append(texts[int(idx)].as_py())
     return results
 
 if __name__ == "__main__":
@@ -148,8 +195,8 @@ if __name__ == "__main__":
         if q.lower() == 'q': break
         
         # Get results
-        res_a = get_results(q, model_a, index_a, k=1)
-        res_b = get_results(q, model_b, index_b, k=1)
+        res_a = get_results(q, "a", index_a, k=1)
+        res_b = get_results(q, "b", index_b, k=1)
         
         print(f"\nQUERY: '{q}'")
         print("-" * 60)
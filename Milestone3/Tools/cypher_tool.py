@@ -1,10 +1,12 @@
 import os
+import re
 from dotenv import load_dotenv
 from typing import Optional, Literal
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field
-from .database import Neo4jConnection
+from .database import get_connection
+from .llm_factory import get_llm
+from .query_cache import QueryLRUCache
 
 # Load environment variables from .env file immediately
 load_dotenv()
@@ -13,82 +15,214 @@ load_dotenv()
 if "GOOGLE_API_KEY" not in os.environ:
     print("Warning: GOOGLE_API_KEY not found in environment. Please ensure it is set in your .env file.")
 
-# Initialize the Gemini Model (Flash is faster/cheaper for this task)
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    temperature=0.0  # Keep it 0 for deterministic results
-)
+# Shared Gemini Flash client (faster/cheaper for this task, temperature 0)
+llm = get_llm("Gemini Flash")
 
 # --- PART A: INTENT CLASSIFICATION ---
 
+Intent = Literal[
+    "flight_search", 
+    "analyze_delays", 
+    "satisfaction_analysis", 
+    "passenger_profiling"
+]
+
 class IntentClassification(BaseModel):
     """Classify the user's operational airline query."""
-    intent: Literal[
-        "flight_search", 
-        "analyze_delays", 
-        "satisfaction_analysis", 
-        "passenger_profiling"
-    ] = Field(..., description="The specific operational goal of the user query.")
-
-classifier_llm = llm.with_structured_output(IntentClassification)
-
-classifier_prompt = ChatPromptTemplate.from_messages([
-    ("system", """
-    You are an operational assistant for an Airline Company.
-    Classify the user query into strictly one of these intents:
-
-    1. flight_search: Find flights, routes, or specific flight details.
-    2. analyze_delays: Analyze delays for flights, routes, or airports.
-    3. satisfaction_analysis: Analyze food satisfaction or customer complaints.
-    4. passenger_profiling: Analyze passenger data, loyalty levels, or history.
-    """),
-    ("human", "{query}"),
-])
-
-classification_chain = classifier_prompt | classifier_llm
+    intent: Intent = Field(..., description="The specific operational goal of the user query.")
 
 # --- PART B: ENTITY EXTRACTION ---
 
+LoyaltyLevel = Literal[
+    "non-elite",
+    "premier silver",
+    "premier gold",
+    "premier platinum",
+    "premier 1k",
+    "global services",
+    "NBK",
+]
+
 class AirlineEntities(BaseModel):
     """Extract relevant entities for the Knowledge Graph."""
-    origin: Optional[str] = Field(None, description="Origin Airport Code (e.g., ORD).")
+    # Only the keys the ROUTES table filters on; a smaller schema means fewer
+    # output tokens from the structured-output decoder.
+    origin: Optional[str] = Field(None, description="Origin or station Airport Code (e.g., ORD).")
     destination: Optional[str] = Field(None, description="Destination Airport Code (e.g., LAX).")
-    station_code: Optional[str] = Field(None, description="Airport Code for station-specific queries.")
     flight_number: Optional[str] = Field(None, description="Flight ID (e.g., AA123).")
     fleet_desc: Optional[str] = Field(None, description="Aircraft model (e.g., Boeing 737). only use the aircraft model number")
     record_locator: Optional[str] = Field(None, description="Passenger Record Locator (PNR).")
-    feedback_id: Optional[str] = Field(None, description="Specific Feedback ID.")
-    level: Optional[str] = Field(None, description="Loyalty Level (Gold, Silver, etc.).")
+    level: Optional[LoyaltyLevel] = Field(None, description="Loyalty program level (e.g., Gold -> premier gold).")
     p_class: Optional[str] = Field(None, description="Passenger Class (Business, Economy, etc.).")
-    gen: Optional[str] = Field(None, description="Generation (Gen Z, Millennials, etc.).")
-    min_delay: Optional[int] = Field(None, description="Minimum delay in minutes.")
-    max_score: Optional[float] = Field(None, description="Maximum food score.")
-    min_miles: Optional[int] = Field(None, description="Minimum flown miles.")
-    max_miles: Optional[int] = Field(None, description="Maximum flown miles.")
-    min_legs: Optional[int] = Field(None, description="Minimum number of legs.")
 
-extractor_llm = llm.with_structured_output(AirlineEntities)
+# --- PART B2: COMBINED PARSE ---
+# One structured-output call returns both the intent and the entities, so the
+# shared system prompt is sent once and each query costs a single round trip.
+
+class AirlineParse(BaseModel):
+    """Classify the airline query and extract its entities in one pass."""
+    intent: Intent = Field(..., description="The specific operational goal of the user query.")
+    entities: AirlineEntities = Field(..., description="Entities mentioned in the query.")
+
+parser_llm = llm.with_structured_output(AirlineParse)
 
-extractor_prompt = ChatPromptTemplate.from_messages([
+parser_prompt = ChatPromptTemplate.from_messages([
     ("system", """
-    Extract entities from the airline query to map to the database schema.
+    You are an operational assistant for an Airline Company. For the user query:
+
+    A. Classify it into strictly one of these intents:
+    1. flight_search: Find flights, routes, or specific flight details.
+    2. analyze_delays: Analyze delays for flights, routes, or airports.
+    3. satisfaction_analysis: Analyze food satisfaction or customer complaints.
+    4. passenger_profiling: Analyze passenger data, loyalty levels, or history.
+
+    B. Extract entities to map to the database schema.
     - Convert city names to airport codes (e.g., "Chicago" -> "ORD").
-    - Extract numerical values for min/max filters.
     - If an entity is missing, return null.
     """),
     ("human", "{query}"),
 ])
 
-extraction_chain = extractor_prompt | extractor_llm
+parse_chain = parser_prompt | parser_llm
 
-# --- MAIN PIPELINE ---
+# --- PART C: QUERY CACHE ---
+# Repeated queries reuse the earlier intent/entities instead of calling the
+# LLM again. Exact (normalized) matches only: "from IAX to LAX" and "from LAX
+# to IAX" read almost the same but must not share entities.
+nlu_cache = QueryLRUCache(maxsize=1024)
+
+def cached_classify_and_extract(user_input: str):
+    """
+    Returns (IntentClassification, AirlineEntities) for the query, served from
+    the cache when the same query was already answered.
+    """
+    cached = nlu_cache.lookup(user_input)
+    if cached is not None:
+        print("✅ NLU cache hit")
+        return cached
+
+    parsed = parse_chain.invoke({"query": user_input})
+    intent_result = IntentClassification(intent=parsed.intent)
+    entity_result = parsed.entities
+
+    nlu_cache.insert(user_input, (intent_result, entity_result))
+    return intent_result, entity_result
+
+# --- CYPHER TEMPLATES ---
+
+# --- GROUP 1: FLIGHT LOOKUP & ROUTES (3 Queries) ---
+
+# Q1: Find Flights by Origin AND Destination
+Q1_ROUTE_FLIGHTS = """
+MATCH (o:Airport {station_code: $origin})<-[:DEPARTS_FROM]-(f:Flight)-[:ARRIVES_AT]->(d:Airport {station_code: $destination})
+USING INDEX o:Airport(station_code)
+USING INDEX d:Airport(station_code)
+USING JOIN ON f
+RETURN f.flight_number, f.fleet_type_description, o.station_code as Origin, d.station_code as Dest
+LIMIT 10;
+"""
+
+# Q2: Find Flights Arriving at a Specific Airport
+Q2_ARRIVING_FLIGHTS = """
+MATCH (f:Flight)-[:ARRIVES_AT]->(a:Airport {station_code: $destination})
+RETURN f.flight_number, f.fleet_type_description, a.station_code as Destination
+LIMIT 15;
+"""
+
+# Q3: Lookup Specific Flight Details (by Flight Number)
+Q3_FLIGHT_DETAILS = """
+MATCH (o:Airport)<-[:DEPARTS_FROM]-(f:Flight {flight_number: $flight_number})-[:ARRIVES_AT]->(d:Airport)
+USING INDEX f:Flight(flight_number)
+RETURN f.flight_number, f.fleet_type_description, o.station_code as Origin, d.station_code as Dest;
+"""
+
+# --- GROUP 2: DELAY ANALYSIS (3 Queries) ---
+
+# Q4: Analyze Average Delays for a Specific Route (Origin -> Dest)
+Q4_ROUTE_DELAYS = """
+MATCH (o:Airport {station_code: $origin})<-[:DEPARTS_FROM]-(f:Flight)-[:ARRIVES_AT]->(d:Airport {station_code: $destination})
+USING INDEX o:Airport(station_code)
+USING INDEX d:Airport(station_code)
+USING JOIN ON f
+MATCH (j:Journey)-[:ON]->(f)
+RETURN f.flight_number, avg(j.arrival_delay_minutes) as Avg_Delay, max(j.arrival_delay_minutes) as Max_Delay
+ORDER BY Avg_Delay DESC;
+"""
+
+# Q5: Identify "Problem Airports" (High Delays departing from X)
+Q5_PROBLEM_AIRPORT = """
+MATCH (f:Flight)-[:DEPARTS_FROM]->(a:Airport {station_code: $origin})
+MATCH (j:Journey)-[:ON]->(f)
+WITH f, avg(j.arrival_delay_minutes) as flight_avg_delay
+WHERE flight_avg_delay > 15
+RETURN f.flight_number, f.fleet_type_description, flight_avg_delay
+ORDER BY flight_avg_delay DESC LIMIT 5;
+"""
+
+# Q6: Analyze Delays by Fleet Type (e.g., "Are Boeing 737s usually late?")
+# Full-text index narrows the flights (one wildcard term per alphanumeric
+# piece of the name); CONTAINS keeps the exact substring semantics
+Q6_FLEET_DELAYS = """
+CALL db.index.fulltext.queryNodes('fleet_ft', $fleet_query) YIELD node AS f
+WITH f WHERE f.fleet_type_description CONTAINS $fleet_desc
+MATCH (j:Journey)-[:ON]->(f)
+RETURN f.fleet_type_description as Fleet, avg(j.arrival_delay_minutes) as Avg_Delay
+LIMIT 5;
+"""
+
+# --- GROUP 3: PASSENGER SATISFACTION (2 Queries) ---
+
+# Q7: Food Satisfaction by Passenger Class (Business vs Economy)
+Q7_CLASS_FOOD = """
+MATCH (j:Journey {passenger_class: $p_class})-[:ON]->(f:Flight)
+RETURN j.passenger_class, avg(j.food_satisfaction_score) as Avg_Food_Score, count(j) as Total_Pax
+"""
+
+# Q8: Customer Complaints Check (Find flights with low satisfaction)
+# Default query if no specific entity is provided, finds worst flights
+Q8_LOW_SATISFACTION = """
+MATCH (j:Journey)-[:ON]->(f:Flight)
+WITH f, avg(j.food_satisfaction_score) as score
+WHERE score < 3
+RETURN f.flight_number, f.fleet_type_description, score
+ORDER BY score ASC LIMIT 5;
+"""
+
+# --- GROUP 4: PASSENGER PROFILING (2 Queries) ---
+
+# Q9: Loyalty Program Analysis (e.g., "Do Gold members complain more?")
+Q9_LOYALTY = """
+MATCH (p:Passenger {loyalty_program_level: $level})-[:TOOK]->(j:Journey)
+RETURN p.loyalty_program_level, avg(j.food_satisfaction_score) as Avg_Food_Rating, avg(j.arrival_delay_minutes) as Avg_Delay_Exp
+"""
+
+# Q10: Passenger History Lookup (by Record Locator)
+Q10_PASSENGER_HISTORY = """
+MATCH (p:Passenger {record_locator: $record_locator})-[:TOOK]->(j:Journey)-[:ON]->(f:Flight)
+RETURN p.record_locator, f.flight_number, j.passenger_class, j.arrival_delay_minutes
+"""
+
+# Router: (intent, required entities, template, parameter keys), checked in
+# order; first match wins. Only the parameter keys are sent to Neo4j.
+ROUTES = [
+    ("flight_search", ("origin", "destination"), Q1_ROUTE_FLIGHTS, ("origin", "destination")),
+    ("flight_search", ("destination",), Q2_ARRIVING_FLIGHTS, ("destination",)),
+    ("flight_search", ("flight_number",), Q3_FLIGHT_DETAILS, ("flight_number",)),
+    ("analyze_delays", ("origin", "destination"), Q4_ROUTE_DELAYS, ("origin", "destination")),
+    ("analyze_delays", ("origin",), Q5_PROBLEM_AIRPORT, ("origin",)),
+    ("analyze_delays", ("fleet_desc",), Q6_FLEET_DELAYS, ("fleet_desc", "fleet_query")),
+    ("satisfaction_analysis", ("p_class",), Q7_CLASS_FOOD, ("p_class",)),
+    ("satisfaction_analysis", (), Q8_LOW_SATISFACTION, ()),
+    ("passenger_profiling", ("level",), Q9_LOYALTY, ("level",)),
+    ("passenger_profiling", ("record_locator",), Q10_PASSENGER_HISTORY, ("record_locator",)),
+]
 
-# Initialize DB Connection
-db = Neo4jConnection()
+# --- MAIN PIPELINE ---
 
 def generate_cypher_query(intent, entities):
     """
-    Returns a tuple: (Cypher Query String, Parameters Dictionary)
+    Returns a tuple: (Cypher Query String, Parameters Dictionary), where the
+    parameters are only the ones the chosen template references.
     Matches the schema: Passenger, Journey, Flight, Airport
     """
     
@@ -97,114 +231,16 @@ def generate_cypher_query(intent, entities):
     if entities.get('flight_number') and isinstance(entities['flight_number'], str) and entities['flight_number'].isdigit():
         entities['flight_number'] = int(entities['flight_number'])
 
-    # --- GROUP 1: FLIGHT LOOKUP & ROUTES (3 Queries) ---
-    
-    # Q1: Find Flights by Origin AND Destination
-    if intent == "flight_search" and entities.get('origin') and entities.get('destination'):
-        query = """
-        MATCH (f:Flight)-[:DEPARTS_FROM]->(o:Airport {station_code: $origin})
-        MATCH (f)-[:ARRIVES_AT]->(d:Airport {station_code: $destination})
-        RETURN f.flight_number, f.fleet_type_description, o.station_code as Origin, d.station_code as Dest
-        LIMIT 10;
-        """
-        return query, entities
-
-    # Q2: Find Flights Arriving at a Specific Airport (Your current working query)
-    if intent == "flight_search" and entities.get('destination'):
-        query = """
-        MATCH (f:Flight)-[:ARRIVES_AT]->(a:Airport {station_code: $destination})
-        RETURN f.flight_number, f.fleet_type_description, a.station_code as Destination
-        LIMIT 15;
-        """
-        return query, entities
-
-    # Q3: Lookup Specific Flight Details (by Flight Number)
-    if intent == "flight_search" and entities.get('flight_number'):
-        query = """
-        MATCH (f:Flight {flight_number: $flight_number})
-        MATCH (f)-[:DEPARTS_FROM]->(o:Airport)
-        MATCH (f)-[:ARRIVES_AT]->(d:Airport)
-        RETURN f.flight_number, f.fleet_type_description, o.station_code as Origin, d.station_code as Dest;
-        """
-        return query, entities
-
-
-    # --- GROUP 2: DELAY ANALYSIS (3 Queries) ---
-
-    # Q4: Analyze Average Delays for a Specific Route (Origin -> Dest)
-    if intent == "analyze_delays" and entities.get('origin') and entities.get('destination'):
-        query = """
-        MATCH (f:Flight)-[:DEPARTS_FROM]->(o:Airport {station_code: $origin})
-        MATCH (f)-[:ARRIVES_AT]->(d:Airport {station_code: $destination})
-        MATCH (j:Journey)-[:ON]->(f)
-        RETURN f.flight_number, avg(j.arrival_delay_minutes) as Avg_Delay, max(j.arrival_delay_minutes) as Max_Delay
-        ORDER BY Avg_Delay DESC;
-        """
-        return query, entities
-
-    # Q5: Identify "Problem Airports" (High Delays departing from X)
-    if intent == "analyze_delays" and entities.get('origin'):
-        query = """
-        MATCH (f:Flight)-[:DEPARTS_FROM]->(a:Airport {station_code: $origin})
-        MATCH (j:Journey)-[:ON]->(f)
-        WITH f, avg(j.arrival_delay_minutes) as flight_avg_delay
-        WHERE flight_avg_delay > 15
-        RETURN f.flight_number, f.fleet_type_description, flight_avg_delay
-        ORDER BY flight_avg_delay DESC LIMIT 5;
-        """
-        return query, entities
-
-    # Q6: Analyze Delays by Fleet Type (e.g., "Are Boeing 737s usually late?")
-    if intent == "analyze_delays" and entities.get('fleet_desc'):
-        query = """
-        MATCH (j:Journey)-[:ON]->(f:Flight)
-        WHERE f.fleet_type_description CONTAINS $fleet_desc
-        RETURN f.fleet_type_description as Fleet, avg(j.arrival_delay_minutes) as Avg_Delay
-        LIMIT 5;
-        """
-        return query, entities
-
-
-    # --- GROUP 3: PASSENGER SATISFACTION (2 Queries) ---
-
-    # Q7: Food Satisfaction by Passenger Class (Business vs Economy)
-    if intent == "satisfaction_analysis" and entities.get('p_class'):
-        query = """
-        MATCH (j:Journey {passenger_class: $p_class})-[:ON]->(f:Flight)
-        RETURN j.passenger_class, avg(j.food_satisfaction_score) as Avg_Food_Score, count(j) as Total_Pax
-        """
-        return query, entities
-
-    # Q8: Customer Complaints Check (Find flights with low satisfaction)
-    if intent == "satisfaction_analysis": 
-        # Default query if no specific entity is provided, finds worst flights
-        query = """
-        MATCH (j:Journey)-[:ON]->(f:Flight)
-        WITH f, avg(j.food_satisfaction_score) as score
-        WHERE score < 3
-        RETURN f.flight_number, f.fleet_type_description, score
-        ORDER BY score ASC LIMIT 5;
-        """
-        return query, entities
-
-
-    # --- GROUP 4: PASSENGER PROFILING (2 Queries) ---
-
-    # Q9: Loyalty Program Analysis (e.g., "Do Gold members complain more?")
-    if intent == "passenger_profiling" and entities.get('level'):
-        query = """
-        MATCH (p:Passenger {loyalty_program_level: $level})-[:TOOK]->(j:Journey)
-        RETURN p.loyalty_program_level, avg(j.food_satisfaction_score) as Avg_Food_Rating, avg(j.arrival_delay_minutes) as Avg_Delay_Exp
-        """
-        return query, entities
-
-    # Q10: Passenger History Lookup (by Record Locator)
-    if intent == "passenger_profiling" and entities.get('record_locator'):
-        query = """
-        MATCH (p:Passenger {record_locator: $record_locator})-[:TOOK]->(j:Journey)-[:ON]->(f:Flight)
-        RETURN p.record_locator, f.flight_number, j.passenger_class, j.arrival_delay_minutes
-        """
-        return query, entities
+    # Lucene wildcard query for the fleet full-text index (Q6). The analyzer
+    # splits "B737-800" into b737/800, so each alphanumeric piece is matched
+    # as its own term; CONTAINS in the template still checks the full string.
+    if entities.get('fleet_desc'):
+        pieces = re.findall(r"[A-Za-z0-9]+", entities['fleet_desc'])
+        entities['fleet_query'] = " AND ".join(f"*{p.lower()}*" for p in pieces) or "*"
+
+    for route_intent, required, query, param_keys in ROUTES:
+        if intent == route_intent and all(entities.get(k) for k in required):
+            return query, {k: entities[k] for k in param_keys}
 
     # Fallback if no specific template matches
     return None, None
@@ -213,12 +249,9 @@ def generate_cypher_query(intent, entities):
 def process_user_query(user_input: str):
     print(f"--- Processing: '{user_input}' ---")
     
-    # Step 1: Classify Intent
-    intent_result = classification_chain.invoke({"query": user_input})
+    # Step 1 & 2: Classify Intent and Extract Entities (query cache in front)
+    intent_result, entity_result = cached_classify_and_extract(user_input)
     print(f"✅ Intent: {intent_result.intent}")
-    
-    # Step 2: Extract Entities
-    entity_result = extraction_chain.invoke({"query": user_input})
     print(f"✅ Entities: {entity_result.model_dump()}")
     
     # Step 3: Generate Cypher Query (Router)
@@ -231,7 +264,8 @@ def process_user_query(user_input: str):
         
         # Step 4: Execute Query
         print("--- Executing in Neo4j ---")
-        results = db.query(cypher_query, params)
+        # Shared pooled connection (closed at exit)
+        results = get_connection().query(cypher_query, params)
         if results:
             print(f"✅ Results ({len(results)} records):")
             for r in results:
@@ -247,15 +281,12 @@ def process_user_query(user_input: str):
 # --- TEST EXAMPLES ---
 if __name__ == "__main__":
     print("--- Airline Assistant (Type 'quit' to exit) ---")
-    try:
-        while True:
-            user_query = input("\nEnter your query: ")
-            if user_query.lower() in ["quit", "exit"]:
-                break
-            
-            try:
-                process_user_query(user_query)
-            except Exception as e:
-                print(f"Error processing query: {e}")
-    finally:
-        db.close()
+    while True:
+        user_query = input("\nEnter your query: ")
+        if user_query.lower() in ["quit", "exit"]:
+            break
+        
+        try:
+            process_user_query(user_query)
+        except Exception as e:
+            print(f"Error processing query: {e}")
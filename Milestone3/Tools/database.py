@@ -1,6 +1,15 @@
 import os
-from neo4j import GraphDatabase
+import atexit
+import threading
+from functools import lru_cache
+from neo4j import GraphDatabase, Result
 
+# Driver pool sizing: enough for the parallel graph branches times the
+# evaluation's concurrent runs; callers wait up to 30s for a free connection.
+MAX_POOL_SIZE = 16
+ACQUISITION_TIMEOUT = 30
+
+@lru_cache(maxsize=1)
 def load_config(file_path="../config.txt"):
     config = {}
     try:
@@ -14,22 +23,26 @@ def load_config(file_path="../config.txt"):
         print(f"Error: {file_path} not found.")
         return None
     
-config = load_config()
-URI = config.get("uri")
-USER = config.get("username")
-PASSWORD = config.get("password")    
-    
 class Neo4jConnection:
     def __init__(self):
-        # Placeholder credentials - PLEASE UPDATE THESE
-        config = load_config()
+        # Config is parsed once per process and only when a connection is made,
+        # so importing this module never fails on a missing config.txt
+        config = load_config() or {}
+        uri = config.get("uri")
         self.driver = None
         try:
-            self.driver = GraphDatabase.driver(URI, auth=(USER, PASSWORD))
+            self.driver = GraphDatabase.driver(
+                uri,
+                auth=(config.get("username"), config.get("password")),
+                max_connection_pool_size=MAX_POOL_SIZE,
+                connection_acquisition_timeout=ACQUISITION_TIMEOUT,
+            )
             self.driver.verify_connectivity()
-            print(f"✅ Connected to Neo4j at {URI}")
+            print(f"✅ Connected to Neo4j at {uri}")
         except Exception as e:
             print(f"❌ Failed to connect to Neo4j: {e}")
+            self.close()
+            self.driver = None
 
     def close(self):
         if self.driver:
@@ -39,14 +52,33 @@ class Neo4jConnection:
         if not self.driver:
             return None
         
-        with self.driver.session() as session:
-            try:
-                result = session.run(cypher_query, parameters)
-                return [record.data() for record in result]
-            except Exception as e:
-                print(f"❌ Query failed: {e}")
-                return None
+        # execute_query manages the session/transaction from the driver pool,
+        # on the server's default database (the one Create_kg.py writes to)
+        try:
+            return self.driver.execute_query(
+                cypher_query,
+                parameters_=parameters or {},
+                result_transformer_=Result.data,
+            )
+        except Exception as e:
+            print(f"❌ Query failed: {e}")
+            return None
 
 # Singleton instance
-# db = Neo4jConnection() 
-# We will initialize this in the main script to avoid connection on import if credentials aren't set
+_connection = None
+_connection_lock = threading.Lock()
+
+def get_connection():
+    """
+    Process-wide connection. The driver keeps a pool of open sessions, so
+    callers reuse it instead of reconnecting per query; it is closed at exit.
+    A failed connection is not kept: the next call tries again, so the agent
+    recovers once Neo4j comes up.
+    """
+    global _connection
+    with _connection_lock:
+        if _connection is None or _connection.driver is None:
+            _connection = Neo4jConnection()
+            if _connection.driver is not None:
+                atexit.register(_connection.close)
+        return _connection
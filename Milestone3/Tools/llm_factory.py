@@ -1,4 +1,5 @@
 import os
+from functools import lru_cache
 from typing import Literal
 from dotenv import load_dotenv
 from langchain_google_genai import ChatGoogleGenerativeAI
@@ -6,9 +7,12 @@ from langchain_huggingface import ChatHuggingFace, HuggingFaceEndpoint
 
 load_dotenv()
 
+@lru_cache(maxsize=8)
 def get_llm(model_name: str):
     """
     Factory function to return the requested LLM instance.
+    Instances are cached per model name, so every caller (NLU chains, prompt
+    engineer, synthesizer) reuses one client and its open connections.
     """
     if model_name == "Gemini Flash":
         if "GOOGLE_API_KEY" not in os.environ:
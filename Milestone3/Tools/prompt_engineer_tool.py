@@ -1,15 +1,30 @@
-import os
-import google.generativeai as genai
-from dotenv import load_dotenv
+import re
+from langchain_core.messages import SystemMessage, HumanMessage
+from .llm_factory import get_llm
+from .query_cache import QueryLRUCache
 
-# 1. Setup Gemini
-load_dotenv()
-api_key = os.getenv("GOOGLE_API_KEY")
-if not api_key:
-    raise ValueError("Error: GOOGLE_API_KEY not found in environment.")
+# Deterministic versions of the TRANSLATION RULES below. A query that is
+# exactly one of these phrases is rewritten locally without an LLM call;
+# anything longer goes to the LLM, which rewrites the whole sentence.
+REWRITES = [
+    (re.compile(r"good food"), "The food was delicious and excellent"),
+    (re.compile(r"bad food"), "The food was terrible and poor"),
+    (re.compile(r"average( food)?"), "The food was average"),
+    (re.compile(r"late"), "The flight was significantly delayed"),
+    (re.compile(r"on[- ]time"), "The flight was on time"),
+]
 
-genai.configure(api_key=api_key)
-model = genai.GenerativeModel('gemini-2.5-flash')
+def apply_rewrites(user_input: str):
+    """Returns the rewritten query, or None unless the whole query is a rule phrase."""
+    normalized = " ".join(user_input.lower().split()).strip(" ?.!")
+    for pattern, replacement in REWRITES:
+        if pattern.fullmatch(normalized):
+            return replacement
+    return None
+
+# Exact-match cache of previous rewrites; a close paraphrase could carry
+# different airport codes and numbers, so only the same query is reused.
+rewrite_cache = QueryLRUCache()
 
 def optimize_query(user_input: str) -> str:
     """
@@ -17,6 +32,14 @@ def optimize_query(user_input: str) -> str:
     of the airline vector database.
     """
     print(f"   [Tool] Optimizing query: '{user_input}'")
+
+    rewritten = apply_rewrites(user_input)
+    if rewritten:
+        return rewritten
+
+    cached = rewrite_cache.lookup(user_input)
+    if cached is not None:
+        return cached
     
     system_instruction = """
     You are a query optimizer for an airline database. 
@@ -30,11 +53,13 @@ def optimize_query(user_input: str) -> str:
     * On Time   -> "The flight was on time"
     """
     
-    prompt = f"{system_instruction}\n\nUser: {user_input}\nOptimized:"
-    
     try:
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        # Same Gemini client as the NLU chains (see llm_factory)
+        llm = get_llm("Gemini Flash")
+        response = llm.invoke([SystemMessage(content=system_instruction), HumanMessage(content=user_input)])
+        optimized = response.content.strip()
+        rewrite_cache.insert(user_input, optimized)
+        return optimized
     except Exception as e:
         print(f"   [Error] Prompt Engineer failed: {e}")
         return user_input # Fallback
\ No newline at end of file
@@ -0,0 +1,40 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def cache_key(query: str) -> str:
+    """Exact-match key: SHA-256 of the lowercased, whitespace-collapsed query."""
+    normalized = " ".join(query.lower().split())
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+class QueryLRUCache:
+    """
+    Thread-safe cache for LLM results keyed by the normalized user query.
+    Exact matches only: the cached values depend on the literal query
+    (airport codes, flight numbers, word order). Least recently used
+    entries are evicted once maxsize is reached; maxsize=0 keeps nothing.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # query key -> value
+        self._lock = threading.Lock()
+
+    def lookup(self, query: str):
+        """Returns the cached value for query, or None on a miss."""
+        key = cache_key(query)
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def insert(self, query: str, value):
+        key = cache_key(query)
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
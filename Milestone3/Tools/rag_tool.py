@@ -1,48 +1,129 @@
+import os
 import faiss
 import pickle
+import threading
 import numpy as np
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Union
 from sentence_transformers import SentenceTransformer
 
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Artifacts written by vector_embedding.py live in the Milestone3 directory
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INDEX_PATH = os.path.join(BASE_DIR, "airline_db.index")
+TEXTS_PATH = os.path.join(BASE_DIR, "airline_texts.pkl")
+
+QUERY_CACHE_SIZE = 4096  # most recent query embeddings kept in memory (0 = off)
+
+@lru_cache(maxsize=1)
+def get_embedder():
+    """Process-wide SentenceTransformer shared by every tool that embeds text."""
+    return SentenceTransformer(EMBEDDING_MODEL)
+
 # 1. Load Artifacts (Executes once when this file is imported)
 print("   [Tool] Loading RAG Knowledge Base...")
 try:
-    # Load Index
-    index = faiss.read_index("airline_db.index")
-    
-    # Load Text Chunks
-    with open("airline_texts.pkl", "rb") as f:
-        feature_texts = pickle.load(f)
-        
     # Load Model (Must be same as vector_embedding.py)
-    embedder = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+    embedder = get_embedder()
+except Exception as e:
+    print(f"CRITICAL ERROR: Could not load embedding model. {e}")
+    embedder = None
+
+# Loaded knowledge bases: index path -> (index, texts, (index mtime, texts mtime))
+_faiss_cache = {}
+_faiss_cache_lock = threading.Lock()
+
+def load_knowledge_base(index_path: str = INDEX_PATH, texts_path: str = TEXTS_PATH):
+    """
+    Returns (index, texts), loading them once per process and again only when
+    either file on disk changes (e.g. after vector_embedding.py rebuilds them).
+    """
+    if not os.path.exists(index_path):
+        raise FileNotFoundError(f"{index_path} not found (run vector_embedding.py to build it)")
+    # Both files, since the builder writes the index before the texts
+    mtimes = (os.path.getmtime(index_path), os.path.getmtime(texts_path))
+
+    with _faiss_cache_lock:
+        cached = _faiss_cache.get(index_path)
+        if cached and cached[2] == mtimes:
+            return cached[0], cached[1]
+
+        index = faiss.read_index(index_path)
+        if hasattr(index, "hnsw"):
+            index.hnsw.efSearch = 64  # recall/speed trade-off at query time
+
+        with open(texts_path, "rb") as f:
+            texts = pickle.load(f)
+
+        _faiss_cache[index_path] = (index, texts, mtimes)
+        return index, texts
+
+try:
+    load_knowledge_base()
     print("   [Tool] Knowledge Base Loaded.")
-    
 except Exception as e:
+    # Don't crash on import; search reports the error if called.
     print(f"CRITICAL ERROR: Could not load RAG artifacts. {e}")
-    # Create empty placeholders to prevent crash on import, 
-    # but search will fail if called.
-    index = None
-    feature_texts = []
-    embedder = None
 
-def search_knowledge_base(query: str, k: int = 3):
+# LRU of query text -> embedding, so repeated queries skip the encoder
+_query_vecs = OrderedDict()
+_query_vecs_lock = threading.Lock()
+
+def embed_queries(queries: List[str]):
     """
-    Embeds the query and searches the FAISS index.
-    Returns a list of the top k text chunks.
+    Unit-length embeddings (matching the inner-product index) for queries.
+    Previously seen texts come from the cache; the rest are encoded in one batch.
+    """
+    vecs = {}
+    with _query_vecs_lock:
+        for q in queries:
+            if q in _query_vecs:
+                _query_vecs.move_to_end(q)
+                vecs[q] = _query_vecs[q]
+
+    misses = list(dict.fromkeys(q for q in queries if q not in vecs))
+    if misses:
+        encoded = embedder.encode(misses, batch_size=32, convert_to_numpy=True, normalize_embeddings=True)
+        with _query_vecs_lock:
+            for q, vec in zip(misses, encoded):
+                vecs[q] = _query_vecs[q] = vec
+            while len(_query_vecs) > QUERY_CACHE_SIZE:
+                _query_vecs.popitem(last=False)
+
+    return np.stack([vecs[q] for q in queries]).astype(np.float32)
+
+def batch_search(queries: List[str], k: int = 3):
     """
+    Embeds all queries in one forward pass and searches the FAISS index once.
+    Returns one list of the top k text chunks per query.
+    """
+    try:
+        index, feature_texts = load_knowledge_base()
+    except Exception:
+        index = None
     if not index or not embedder:
-        return ["Error: Database not loaded."]
+        return [["Error: Database not loaded."] for _ in queries]
+
+    # 1. Embed Queries (cached)
+    query_vecs = embed_queries(queries)
 
-    # 1. Embed Query
-    query_vec = embedder.encode([query], convert_to_numpy=True)
-    
     # 2. Search FAISS
-    distances, indices = index.search(query_vec, k)
-    
+    distances, indices = index.search(query_vecs, k)
+
     # 3. Retrieve Documents
-    results = []
-    for idx in indices[0]:
-        if idx < len(feature_texts):
-            results.append(feature_texts[idx])
-            
-    return results
\ No newline at end of file
+    return [
+        [feature_texts[idx] for idx in row if 0 <= idx < len(feature_texts)]
+        for row in indices
+    ]
+
+def search_knowledge_base(query: Union[str, List[str]], k: int = 3):
+    """
+    Embeds the query and searches the FAISS index.
+    Returns a list of the top k text chunks, or one such list per query
+    when given a list of queries.
+    """
+    if isinstance(query, str):
+        return batch_search([query], k)[0]
+    return batch_search(query, k)
@@ -1,10 +1,16 @@
 import os
 import faiss
 import numpy as np
+import pandas as pd
 import pickle
+import torch
+from itertools import islice
 from neo4j import GraphDatabase
 from sentence_transformers import SentenceTransformer
 
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"  # must match rag_tool.EMBEDDING_MODEL
+BATCH_SIZE = 1024  # records serialized, encoded and indexed per step
+
 # ---------------------------------------------------------
 # 1. Load Credentials from config.txt
 # ---------------------------------------------------------
@@ -47,84 +53,138 @@ def fetch_graph_data(uri, username, password):
         dest.station_code AS dest_code
     """
     
-    records = []
+    # Records are yielded as the driver receives them, so the full result
+    # set is never held in memory at once
+    count = 0
     try:
         with driver.session() as session:
-            result = session.run(query)
-            records = [record.data() for record in result]
-            print(f"Successfully extracted {len(records)} records from Neo4j.")
+            for record in session.run(query):
+                count += 1
+                yield record.data()
+            print(f"Successfully extracted {count} records from Neo4j.")
     except Exception as e:
         print(f"Failed to connect or query Neo4j: {e}")
     finally:
         driver.close()
-        
-    return records
+
+def batched(records, size=BATCH_SIZE):
+    """Groups an iterable of records into lists of at most size items."""
+    records = iter(records)
+    while batch := list(islice(records, size)):
+        yield batch
+
+# ---------------------------------------------------------
+# 3. Serialize Records to Text
+# ---------------------------------------------------------
+def serialize_records(records):
+    """Vectorized text serialization of one batch of graph records."""
+    df = pd.DataFrame(records)
+    s = {col: df[col].astype(str) for col in df.columns}
+    food_desc = np.where(
+        df['food_score'] >= 8, "delicious and excellent",
+        np.where(df['food_score'] <= 3, "terrible and poor", "average"),
+    )
+    return (
+        "Passenger " + s['passenger_id'] + " (" + s['gen'] + ", " + s['loyalty'] + " status) "
+        + "booked " + s['p_class'] + " class on Flight " + s['flight_num'] + " "
+        + "(operated by " + s['fleet'] + "). "
+        + "The journey from " + s['origin_code'] + " to " + s['dest_code'] + " "
+        + "covered " + s['miles'] + " miles across " + s['legs'] + " leg(s). "
+        + "Feedback: The food was " + food_desc + " (rated " + s['food_score'] + "/10). "
+        + "The flight had an arrival delay of " + s['delay'] + " minutes."
+    ).tolist()
 
 # ---------------------------------------------------------
-# 3. Main Workflow
+# 4. Encode Texts
 # ---------------------------------------------------------
-config = load_config()
-
-if config:
-    graph_data = fetch_graph_data(config.get("uri"), config.get("username"), config.get("password"))
-
-    if graph_data:
-        # B. Text Serialization
-        feature_texts = []
-        for r in graph_data:
-            if r['food_score'] >= 8:
-                food_desc = "delicious and excellent"
-            elif r['food_score'] <= 3:
-                food_desc = "terrible and poor"
-            else:
-                food_desc = "average"
-            
-            text_representation = (
-                f"Passenger {r['passenger_id']} ({r['gen']}, {r['loyalty']} status) "
-                f"booked {r['p_class']} class on Flight {r['flight_num']} "
-                f"(operated by {r['fleet']}). "
-                f"The journey from {r['origin_code']} to {r['dest_code']} "
-                f"covered {r['miles']} miles across {r['legs']} leg(s). "
-                f"Feedback: The food was {food_desc} (rated {r['food_score']}/10). "
-                f"The flight had an arrival delay of {r['delay']} minutes."
-            )
-            feature_texts.append(text_representation)
-
-        # C. Generate Embeddings
+def encode_texts(embedder, texts, pool=None):
+    """
+    Encodes on the GPU in large batches when available; otherwise spreads
+    the batches over the worker processes in pool (one per CPU core).
+    Vectors are unit length, so inner product == cosine similarity.
+    """
+    if pool is None:
+        return embedder.encode(
+            texts, batch_size=256, convert_to_numpy=True, show_progress_bar=False, normalize_embeddings=True
+        )
+    return embedder.encode_multi_process(texts, pool, batch_size=64, normalize_embeddings=True)
+
+# ---------------------------------------------------------
+# 5. Main Workflow
+# ---------------------------------------------------------
+if __name__ == "__main__":
+    config = load_config()
+
+    if config:
+        records = fetch_graph_data(config.get("uri"), config.get("username"), config.get("password"))
+
         print("Loading embedding model...")
-        embedder = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-        
+        embedder = SentenceTransformer(EMBEDDING_MODEL)
+        pool = None
+        if torch.cuda.is_available():
+            embedder.to("cuda")
+        else:
+            pool = embedder.start_multi_process_pool()
+
+        # HNSW graph: approximate, log-time search instead of a full scan.
+        # Vectors are stored as FP16 (half the size of FP32, no training or
+        # range fitting needed) and compared by inner product (cosine, since
+        # they are normalized).
+        d = embedder.get_sentence_embedding_dimension()
+        index = faiss.IndexHNSWSQ(d, faiss.ScalarQuantizer.QT_fp16, 32, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = 200
+
+        # Identical texts would produce identical vectors, so each one is
+        # embedded once
+        seen = set()
+        unique_texts = []
+        record_count = 0
+
         print("Encoding graph data into vectors...")
-        embeddings = embedder.encode(feature_texts, convert_to_numpy=True)
-        print(f"Embedding Shape: {embeddings.shape}")
-
-        # D. Build FAISS Index
-        d = embeddings.shape[1] 
-        index = faiss.IndexFlatL2(d)
-        index.add(embeddings)
-        print(f"FAISS index built successfully! Total vectors: {index.ntotal}")
-
-        # E. Save Index and Texts one directory up
-        save_dir = os.path.abspath(os.path.join(os.getcwd(), ".."))
-        faiss_index_path = os.path.join(save_dir, "airline_db.index")
-        texts_path = os.path.join(save_dir, "airline_texts.pkl")
-
-        faiss.write_index(index, faiss_index_path)
-        print(f"Saved FAISS index to '{faiss_index_path}'")
-
-        with open(texts_path, "wb") as f:
-            pickle.dump(feature_texts, f)
-        print(f"Saved text chunks to '{texts_path}'")
-
-        # Optional: Test Retrieval immediately
-        print("\n--- Sample Serialized Text ---")
-        print(feature_texts[0])
-
-        test_query = "High delay and low food satisfaction"
-        query_emb = embedder.encode([test_query], convert_to_numpy=True)
-        distances, indices = index.search(query_emb, k=1)
+        try:
+            for batch in batched(records):
+                new_texts = []
+                for text in serialize_records(batch):
+                    if text not in seen:
+                        seen.add(text)
+                        new_texts.append(text)
+                record_count += len(batch)
+                if not new_texts:
+                    continue
+
+                embeddings = encode_texts(embedder, new_texts, pool)
+                index.add(embeddings)
+                unique_texts.extend(new_texts)
+                print(f"   Indexed {index.ntotal} unique texts from {record_count} records...")
+        finally:
+            if pool is not None:
+                embedder.stop_multi_process_pool(pool)
+
+        if unique_texts:
+            print(f"FAISS index built successfully! Total vectors: {index.ntotal}")
+
+            # E. Save Index and Texts one directory up
+            save_dir = os.path.abspath(os.path.join(os.getcwd(), ".."))
+            faiss_index_path = os.path.join(save_dir, "airline_db.index")
+            texts_path = os.path.join(save_dir, "airline_texts.pkl")
+
+            faiss.write_index(index, faiss_index_path)
+            print(f"Saved FAISS index to '{faiss_index_path}'")
+
+            with open(texts_path, "wb") as f:
+                pickle.dump(unique_texts, f)
+            print(f"Saved text chunks to '{texts_path}'")
+
+            # Optional: Test Retrieval immediately
+            print("\n--- Sample Serialized Text ---")
+            print(unique_texts[0])
+
+            test_query = "High delay and low food satisfaction"
+            query_emb = embedder.encode([test_query], convert_to_numpy=True, normalize_embeddings=True)
+            index.hnsw.efSearch = 64
+            distances, indices = index.search(query_emb, k=1)
         
-        print("\n--- Test Retrieval ---")
-        print(f"Query: {test_query}")
-        best_match_idx = indices[0][0]
-        print(f"Best Match:\n{feature_texts[best_match_idx]}")
+            print("\n--- Test Retrieval ---")
+            print(f"Query: {test_query}")
+            best_match_idx = indices[0][0]
+            print(f"Best Match:\n{unique_texts[best_match_idx]}")
@@ -1,14 +1,20 @@
 import os
+import re
+import asyncio
+import threading
 import google.generativeai as genai
 from typing import TypedDict, List, Any, Optional, Literal
 from langgraph.graph import StateGraph, START, END
 from dotenv import load_dotenv
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableLambda
+from langchain_core.globals import set_llm_cache
+from langchain_community.cache import SQLiteCache
 
 # --- IMPORT CUSTOM TOOLS ---
 # These imports rely on the files being in the same directory
-from Tools.database import Neo4jConnection
-from Tools.cypher_tool import classification_chain, extraction_chain, generate_cypher_query
+from Tools.database import get_connection
+from Tools.cypher_tool import cached_classify_and_extract, generate_cypher_query
 from Tools.prompt_engineer_tool import optimize_query
 from Tools.rag_tool import search_knowledge_base
 from Tools.llm_factory import get_llm
@@ -16,6 +22,11 @@ from Tools.llm_factory import get_llm
 # Setup Gemini for the final synthesizer
 load_dotenv()
 
+# Persistent LLM response cache: a repeated (model, prompt) pair, e.g. the
+# same question in NLU, synthesis or an evaluation re-run, skips the API call
+LLM_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".langchain_cache.db")
+set_llm_cache(SQLiteCache(database_path=LLM_CACHE_PATH))
+
 # ---------------------------------------------------------
 # 1. DEFINE HYBRID STATE
 # ---------------------------------------------------------
@@ -40,25 +51,23 @@ class HybridState(TypedDict):
     
     # Output
     final_answer: str
+    token_usage: Optional[dict]  # provider-reported usage of the synthesis call
 
 # ---------------------------------------------------------
 # 2. DEFINE SHARED NODES (NLU)
 # ---------------------------------------------------------
 
-def classify_node(state: HybridState):
-    print(f"\n--- NODE: INTENT CLASSIFIER ({state['retrieval_mode']}) ---")
-    response = classification_chain.invoke({"query": state["user_query"]})
-    print(f"Intent: {response.intent}")
-    return {"intent": response.intent}
-
-def extract_node(state: HybridState):
-    print("\n--- NODE: ENTITY EXTRACTOR ---")
-    response = extraction_chain.invoke({"query": state["user_query"]})
-    entities = response.model_dump()
+def nlu_node(state: HybridState):
+    print(f"\n--- NODE: INTENT & ENTITY PARSER ({state['retrieval_mode']}) ---")
+    # One structured-output call for both (cached per query), instead of two
+    # back-to-back LLM round trips
+    intent_result, entity_result = cached_classify_and_extract(state["user_query"])
+    entities = entity_result.model_dump()
     # Filter None values for cleaner logs
     clean_entities = {k: v for k, v in entities.items() if v is not None}
+    print(f"Intent: {intent_result.intent}")
     print(f"Entities: {clean_entities}")
-    return {"entities": entities}
+    return {"intent": intent_result.intent, "entities": entities}
 
 # ---------------------------------------------------------
 # 3. DEFINE BRANCH A NODES (CYPHER)
@@ -71,6 +80,8 @@ def cypher_gen_node(state: HybridState):
         print(f"Generated Cypher (Partial): {query.strip()[:50]}...")
     else:
         print("No Cypher template matched.")
+        # Branch A ends here; record the empty result for the synthesizer
+        return {"cypher_sql": None, "cypher_params": None, "cypher_results": []}
     return {"cypher_sql": query, "cypher_params": params}
 
 def cypher_exec_node(state: HybridState):
@@ -78,13 +89,10 @@ def cypher_exec_node(state: HybridState):
     if not state.get("cypher_sql"):
         return {"cypher_results": []}
     
-    db = Neo4jConnection()
-    try:
-        data = db.query(state["cypher_sql"], state["cypher_params"])
-        print(f"Neo4j returned {len(data)} records.")
-        return {"cypher_results": data}
-    finally:
-        db.close()
+    # Pooled process-wide driver: no connect/handshake per query
+    data = get_connection().query(state["cypher_sql"], state["cypher_params"]) or []
+    print(f"Neo4j returned {len(data)} records.")
+    return {"cypher_results": data}
 
 # ---------------------------------------------------------
 # 4. DEFINE BRANCH B NODES (VECTOR RAG)
@@ -102,51 +110,135 @@ def rag_search_node(state: HybridState):
     print(f"FAISS retrieved {len(docs)} text chunks.")
     return {"vector_docs": docs}
 
+# Async variants for app.ainvoke / app.astream: every node that blocks (LLM
+# calls, the Neo4j driver, embedding + FAISS search) runs in a worker thread,
+# so concurrent runs and the two branches overlap on the event loop instead
+# of stalling it in turn.
+async def nlu_node_async(state: HybridState):
+    return await asyncio.to_thread(nlu_node, state)
+
+async def cypher_exec_node_async(state: HybridState):
+    return await asyncio.to_thread(cypher_exec_node, state)
+
+async def prompt_eng_node_async(state: HybridState):
+    return await asyncio.to_thread(prompt_eng_node, state)
+
+async def rag_search_node_async(state: HybridState):
+    return await asyncio.to_thread(rag_search_node, state)
+
 # ---------------------------------------------------------
 # 5. DEFINE SYNTHESIS NODE (MERGE)
 # ---------------------------------------------------------
 
+RRF_K = 60              # Reciprocal Rank Fusion constant
+MAX_CONTEXT_ROWS = 10   # Cypher rows passed to the LLM
+MAX_CONTEXT_DOCS = 3    # text chunks passed to the LLM
+MAX_DOC_CHARS = 500     # per retrieved text chunk
+
+# Facts a serialized doc states (see vector_embedding.serialize_records)
+DOC_FACTS = re.compile(
+    r"^Passenger (\S+) \(.*?\bon Flight (\S+) \(.*?\(rated ([^/\s]+)/10\)\."
+    r" The flight had an arrival delay of (\S+) minutes\.$",
+    re.S,
+)
+
+# Static part of the synthesis prompt, sent as a system message
+SYNTHESIZER_SYSTEM_PROMPT = """You are an advanced Airline Operations Assistant.
+Answer the user's question based on the active retrieval methods.
+- Use ONLY the provided data.
+- Return answer in a user friendly manner.
+- If a source says "Skipped", do not hallucinate data for it.
+- Prioritize Structured Data for stats/delays, and Text for sentiment."""
+
+def normalize_value(value):
+    """Compares 112, 112.0 and "112" as equal; other values by their text."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+def doc_facts(doc: str):
+    """Set of (normalized) values a serialized doc states, or None if unparsed."""
+    match = DOC_FACTS.match(doc)
+    if not match:
+        return None
+    return {normalize_value(v) for v in match.groups()}
+
+def fuse_context(rows: List[dict], docs: List[str],
+                 max_rows: int = MAX_CONTEXT_ROWS, max_docs: int = MAX_CONTEXT_DOCS):
+    """
+    Rows keep the order the Cypher query returned them in (its ORDER BY is
+    the ranking) and are cut at max_rows. Docs are ranked by Reciprocal Rank
+    Fusion, so a chunk retrieved more than once appears once, and a doc is
+    dropped only when every fact it states (passenger, flight, food score,
+    delay) is in one of the kept rows.
+    """
+    kept_rows = rows[:max_rows]
+    row_values = [{normalize_value(v) for v in row.values()} for row in kept_rows]
+
+    scores = {}
+    for rank, doc in enumerate(docs, 1):
+        scores[doc] = scores.get(doc, 0.0) + 1.0 / (RRF_K + rank)
+
+    fused_docs = []
+    for doc in sorted(scores, key=scores.get, reverse=True):
+        facts = doc_facts(doc)
+        if facts and any(facts <= values for values in row_values):
+            continue
+        fused_docs.append(doc)
+    return kept_rows, fused_docs[:max_docs]
+
+def format_rows(rows: List[dict], total: int) -> str:
+    """Pipe-delimited table of rows (far fewer tokens than str(list_of_dicts))."""
+    columns = list(rows[0].keys())
+    lines = [" | ".join(columns)]
+    lines += [" | ".join(str(row.get(c, "")) for c in columns) for row in rows]
+    if total > len(rows):
+        lines.append(f"... {total - len(rows)} more rows")
+    return "\n".join(lines)
+
+NO_DATA_ANSWER = "I couldn't find any data to answer that question."
+
 def synthesizer_node(state: HybridState):
     print("\n--- NODE: FINAL SYNTHESIS ---")
+
+    # Nothing retrieved on any active branch: the LLM could only say so,
+    # so answer directly and skip the call
+    if not state.get("cypher_results") and not state.get("vector_docs"):
+        print("   [Synthesis] No context retrieved, skipping LLM.")
+        return {"final_answer": NO_DATA_ANSWER}
     
+    # Merge both branches' evidence, dropping docs that repeat a Cypher row
+    rows = state.get("cypher_results") or []
+    fused_rows, fused_docs = fuse_context(rows, state.get("vector_docs") or [])
+
     # Prepare Structured Data Context
     structured_data = "Skipped (Mode: Embeddings Only)"
     if state.get("cypher_results") is not None:
-        if state["cypher_results"]:
-            structured_data = str(state["cypher_results"])
+        if fused_rows:
+            structured_data = format_rows(fused_rows, total=len(rows))
         else:
             structured_data = "No structured data found."
 
     # Prepare Unstructured Data Context
     unstructured_data = "Skipped (Mode: Baseline Only)"
     if state.get("vector_docs") is not None:
-        if state["vector_docs"]:
-            unstructured_data = "\n\n".join(state["vector_docs"])
+        if fused_docs:
+            unstructured_data = "\n\n".join(doc[:MAX_DOC_CHARS] for doc in fused_docs)
         else:
             unstructured_data = "No text context found."
 
-    # Master Prompt
-    prompt_text = f"""
-    You are an advanced Airline Operations Assistant.
-    Answer the user's question based on the active retrieval methods.
-    
-    MODE: {state['retrieval_mode'].upper()}
-
-    1. STRUCTURED DATABASE (Facts, numbers, flight IDs):
-    {structured_data}
+    # Per-query part of the prompt
+    prompt_text = f"""MODE: {state['retrieval_mode'].upper()}
 
-    2. UNSTRUCTURED TEXT (Reviews, feedback, descriptions):
-    {unstructured_data}
+1. STRUCTURED DATABASE (Facts, numbers, flight IDs):
+{structured_data}
 
-    ### USER QUESTION
-    {state['user_query']}
+2. UNSTRUCTURED TEXT (Reviews, feedback, descriptions):
+{unstructured_data}
 
-    ### INSTRUCTIONS
-    - Use ONLY the provided data.
-    - Return answer in a user friendly manner.
-    - If a source says "Skipped", do not hallucinate data for it.
-    - Prioritize Structured Data for stats/delays, and Text for sentiment.
-    """
+### USER QUESTION
+{state['user_query']}"""
 
     try:
         model_name = state.get("selected_model", "Gemini Flash")
@@ -154,21 +246,32 @@ def synthesizer_node(state: HybridState):
         
         llm = get_llm(model_name)
         
-        # Invoke LLM (LangChain interface)
-        # Wrap prompt in HumanMessage for Chat Models
-        messages = [HumanMessage(content=prompt_text)]
+        # Invoke LLM (LangChain interface). invoke() goes through the global
+        # LLM cache; under app.stream(stream_mode="messages") LangGraph's
+        # callbacks still stream the tokens of an uncached call as they arrive.
+        # Wrap prompt in HumanMessage for Chat Models; Mistral's chat
+        # template rejects the system role, so it gets both in one message
+        if model_name == "Mistral-7B":
+            messages = [HumanMessage(content=f"{SYNTHESIZER_SYSTEM_PROMPT}\n\n{prompt_text}")]
+        else:
+            messages = [SystemMessage(content=SYNTHESIZER_SYSTEM_PROMPT), HumanMessage(content=prompt_text)]
         response = llm.invoke(messages)
-        
+
         # Handle different return types
         if hasattr(response, "content"):
             answer = response.content.strip()
         else:
             answer = str(response).strip()
+        usage = getattr(response, "usage_metadata", None)
             
     except Exception as e:
         answer = f"Error during synthesis: {e}"
+        usage = None
 
-    return {"final_answer": answer}
+    return {"final_answer": answer, "token_usage": usage}
+
+async def synthesizer_node_async(state: HybridState):
+    return await asyncio.to_thread(synthesizer_node, state)
 
 # ---------------------------------------------------------
 # 6. BUILD THE GRAPH WITH ROUTING
@@ -176,17 +279,15 @@ def synthesizer_node(state: HybridState):
 workflow = StateGraph(HybridState)
 
 # Add Nodes
-workflow.add_node("classifier", classify_node)
-workflow.add_node("extractor", extract_node)
+workflow.add_node("nlu", RunnableLambda(nlu_node, afunc=nlu_node_async))
 workflow.add_node("cypher_gen", cypher_gen_node)
-workflow.add_node("cypher_exec", cypher_exec_node)
-workflow.add_node("prompt_eng", prompt_eng_node)
-workflow.add_node("rag_search", rag_search_node)
-workflow.add_node("synthesizer", synthesizer_node)
+workflow.add_node("cypher_exec", RunnableLambda(cypher_exec_node, afunc=cypher_exec_node_async))
+workflow.add_node("prompt_eng", RunnableLambda(prompt_eng_node, afunc=prompt_eng_node_async))
+workflow.add_node("rag_search", RunnableLambda(rag_search_node, afunc=rag_search_node_async))
+workflow.add_node("synthesizer", RunnableLambda(synthesizer_node, afunc=synthesizer_node_async))
 
 # --- STANDARD FLOW ---
-workflow.add_edge(START, "classifier")
-workflow.add_edge("classifier", "extractor")
+workflow.add_edge(START, "nlu")
 
 # --- CONDITIONAL ROUTING ---
 def route_mode(state: HybridState):
@@ -200,9 +301,9 @@ def route_mode(state: HybridState):
     else: 
         return ["cypher_gen", "prompt_eng"] # Run Both (Hybrid)
 
-# Configure the split after extraction
+# Configure the split after NLU
 workflow.add_conditional_edges(
-    "extractor",
+    "nlu",
     route_mode,
     {
         "cypher_gen": "cypher_gen",
@@ -212,7 +313,24 @@ workflow.add_conditional_edges(
 
 # --- PATH CONNECTIONS ---
 # Path A: Cypher Execution
-workflow.add_edge("cypher_gen", "cypher_exec")
+def route_cypher(state: HybridState):
+    """
+    Skips cypher_exec when no template matched. In hybrid mode the hop is
+    kept so both branches reach the synthesizer in the same step; jumping
+    ahead would run it before the vector search finished (and again after).
+    """
+    if state.get("cypher_sql") or state["retrieval_mode"] == "hybrid":
+        return "cypher_exec"
+    return "synthesizer"
+
+workflow.add_conditional_edges(
+    "cypher_gen",
+    route_cypher,
+    {
+        "cypher_exec": "cypher_exec",
+        "synthesizer": "synthesizer"
+    }
+)
 workflow.add_edge("cypher_exec", "synthesizer")
 
 # Path B: Vector Search
@@ -224,6 +342,21 @@ workflow.add_edge("synthesizer", END)
 
 app = workflow.compile()
 
+# Build the Hugging Face clients in the background so the first query after
+# switching models doesn't pay for it. PRELOAD_HF_MODELS=0 skips this
+# (e.g. when only Gemini is used).
+PRELOAD_MODELS = ["Mistral-7B", "Zephyr-7B"]
+
+def _preload_llm(model_name: str):
+    try:
+        get_llm(model_name)  # lru_cached, later calls reuse this client
+    except Exception as e:
+        print(f"   [Preload] Skipped {model_name}: {e}")
+
+if os.getenv("PRELOAD_HF_MODELS", "1") != "0":
+    for m in PRELOAD_MODELS:
+        threading.Thread(target=_preload_llm, args=(m,), daemon=True).start()
+
 # ---------------------------------------------------------
 # 7. EXECUTION
 # ---------------------------------------------------------
@@ -274,9 +407,26 @@ if __name__ == "__main__":
             }
             
             try:
-                result = app.invoke(inputs)
-                print("\n>> FINAL ANSWER:")
-                print(result["final_answer"])
+                # Print synthesizer tokens as they are generated; the
+                # "values" stream carries the final state.
+                result = {}
+                streamed = False
+                for mode, payload in app.stream(inputs, stream_mode=["messages", "values"]):
+                    if mode == "values":
+                        result = payload
+                        continue
+                    chunk, metadata = payload
+                    if metadata.get("langgraph_node") == "synthesizer" and chunk.content:
+                        if not streamed:
+                            print("\n>> FINAL ANSWER:")
+                            streamed = True
+                        print(chunk.content, end="", flush=True)
+
+                if streamed:
+                    print()
+                else:
+                    print("\n>> FINAL ANSWER:")
+                    print(result.get("final_answer", ""))
             except Exception as e:
                 print(f"\n[Error] Agent execution failed: {e}")
                 
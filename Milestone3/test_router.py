@@ -1,6 +1,12 @@
 from preprocessing import process_user_query
+import os
 import time
 
+# Seconds to wait between cases, for API keys with tight rate limits.
+# Off by default: each case now makes one LLM call (the combined parse)
+# instead of two, which most keys absorb without pausing.
+DELAY = float(os.getenv("ROUTER_TEST_DELAY", "0"))
+
 test_cases = [
     # GROUP 1: FLIGHT LOOKUP & ROUTES
     {
@@ -71,7 +77,7 @@ test_cases = [
     }
 ]
 
-print("=== STARTING ROUTER TEMPLATE TESTS (With Delays) ===")
+print(f"=== STARTING ROUTER TEMPLATE TESTS (Delay: {DELAY}s) ===")
 
 passed_count = 0
 failed_count = 0
@@ -108,8 +114,9 @@ for case in test_cases:
         failed_count += 1
         failed_tests.append(f"{case['id']} ({case['desc']}): Exception - {str(e)}")
     
-    print("Waiting 5 seconds to respect API limits...")
-    time.sleep(5)
+    if DELAY:
+        print(f"Waiting {DELAY} seconds to respect API limits...")
+        time.sleep(DELAY)
 
 print("\n" + "="*40)
 print("       TEST EXECUTION SUMMARY")